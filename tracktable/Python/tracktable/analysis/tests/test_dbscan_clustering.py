@@ -30,36 +30,81 @@
 from __future__ import division, print_function, absolute_import
 
 import operator
-import random
 import sys
 from six.moves import range
 
+import numpy
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import scipy.sparse
+    import scipy.sparse.csgraph
+    from scipy.spatial import cKDTree
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
 from tracktable.analysis.dbscan import compute_cluster_labels
 
 # Test dbscan in 3 dimensions
 
-def cluster_points_around(central_point, span, count):
-    start_point = [ (c - 0.5 * d) for (c, d) in zip(central_point, span) ]
+# Compiling the numba kernel takes far longer than building a small
+# grid with numpy, so only grids with at least this many points per
+# side go through it.  The kernel is compiled on first use; it is not
+# cached on disk because the test directory may be read-only.
+NUMBA_MIN_GRID_COUNT = 64
+
+if NUMBA_AVAILABLE:
+    @njit
+    def _fill_grid(start_point, delta, count, out):
+        for i in range(count):
+            x = start_point[0] + i * delta[0]
+            for j in range(count):
+                y = start_point[1] + j * delta[1]
+                for k in range(count):
+                    idx = (i * count + j) * count + k
+                    out[idx, 0] = x
+                    out[idx, 1] = y
+                    out[idx, 2] = start_point[2] + k * delta[2]
+
+# ----------------------------------------------------------------------
+
+def grid_points_with_numpy(central_point, span, count):
+    axes = [ numpy.linspace(c - 0.5 * d, c + 0.5 * d, count)
+             for (c, d) in zip(central_point, span) ]
 
-    delta = [ s / float(count-1) for s in span ]
+    # Build the whole count x count x count grid in one shot.  With
+    # indexing='ij' the rows come out in the same (x, y, z) order as
+    # the nested loops this replaced.
+    grid = numpy.meshgrid(*axes, indexing='ij')
+    return numpy.stack(grid, axis=-1).reshape(-1, 3)
 
-    points = []
+# ----------------------------------------------------------------------
 
-    for i in range(count):
-        x = start_point[0] + i * delta[0]
-        for j in range(count):
-            y = start_point[1] + j * delta[1]
-            for k in range(count):
-                z = start_point[2] + k * delta[2]
-                points.append((x, y, z))
+def grid_points_with_numba(central_point, span, count):
+    central_point = numpy.asarray(central_point, dtype=numpy.float64)
+    span = numpy.asarray(span, dtype=numpy.float64)
 
+    points = numpy.empty((count ** 3, 3), dtype=numpy.float64)
+    _fill_grid(central_point - 0.5 * span, span / (count - 1), count, points)
     return points
 
 # ----------------------------------------------------------------------
 
-def place_corner_clusters():
-    all_points = []
+def cluster_points_around(central_point, span, count):
+    if NUMBA_AVAILABLE and count >= NUMBA_MIN_GRID_COUNT:
+        return grid_points_with_numba(central_point, span, count)
+    else:
+        return grid_points_with_numpy(central_point, span, count)
 
+# ----------------------------------------------------------------------
+
+def place_corner_clusters():
     corners = [
         (0, 0, 0),
         (1, 0, 0),
@@ -71,34 +116,95 @@ def place_corner_clusters():
         (1, 1, 1)
         ]
 
-    for corner in corners:
-        all_points.extend(cluster_points_around(corner, (0.1, 0.1, 0.1), 8))
+    return numpy.concatenate([
+        cluster_points_around(corner, (0.1, 0.1, 0.1), 8)
+        for corner in corners
+        ])
+
+# ----------------------------------------------------------------------
 
-    return all_points
+def place_noise_points(center, span, count, rng=None):
+    center = numpy.asarray(center, dtype=numpy.float64)
+    half_span = 0.5 * numpy.asarray(span, dtype=numpy.float64)
+
+    if rng is None:
+        rng = numpy.random.default_rng()
+    return rng.uniform(center - half_span, center + half_span, size=(count, 3))
 
 # ----------------------------------------------------------------------
 
-def place_noise_points(center, span, count):
-    all_points = []
+def reference_core_clusters(points, search_box_half_span, min_cluster_size):
+    """Find DBSCAN core points and their clusters with a KD-tree.
+
+    This is an independent check on compute_cluster_labels().  We
+    scale the coordinates so that the search box becomes the unit box,
+    ask a KD-tree for every pair of points within it (the Chebyshev
+    metric, since the box is axis-aligned), and treat that as a
+    precomputed sparse neighbor graph.  Core points are the ones with
+    at least min_cluster_size neighbors; clusters are the connected
+    components of the graph restricted to core points.
+
+    Border points can legitimately go to either of two adjacent
+    clusters, so we only report core points.
+
+    Returns:
+       Dictionary mapping core point index to reference cluster number
+    """
 
-    for point_id in range(count):
-        x = random.uniform(center[0] - 0.5 * span[0], center[0] + 0.5 * span[0])
-        y = random.uniform(center[1] - 0.5 * span[1], center[1] + 0.5 * span[1])
-        z = random.uniform(center[2] - 0.5 * span[2], center[2] + 0.5 * span[2])
-        all_points.append([x, y, z])
+    scaled = points / numpy.asarray(search_box_half_span, dtype=numpy.float64)
+    tree = cKDTree(scaled)
 
-    return all_points
+    neighbor_counts = tree.query_ball_point(scaled, r=1, p=numpy.inf, return_length=True)
+    is_core = neighbor_counts >= min_cluster_size
+
+    pairs = tree.query_pairs(r=1, p=numpy.inf, output_type='ndarray')
+    pairs = pairs[is_core[pairs[:, 0]] & is_core[pairs[:, 1]]]
+    graph = scipy.sparse.coo_matrix(
+        (numpy.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+        shape=(len(points), len(points)))
+
+    (_, component) = scipy.sparse.csgraph.connected_components(graph, directed=False)
+
+    return dict(
+        (int(index), int(component[index])) for index in numpy.flatnonzero(is_core)
+        )
+
+# ----------------------------------------------------------------------
+
+def compare_with_reference(cluster_ids, reference_clusters):
+    """Check that DBSCAN groups core points the same way as the reference.
+
+    Cluster numbers are arbitrary, so we require a one-to-one mapping
+    between DBSCAN's labels and the reference labels on core points.
+
+    Returns:
+       Number of core points whose labels disagree
+    """
+
+    labels = dict(cluster_ids)
+    reference_to_label = {}
+    label_to_reference = {}
+    mismatches = 0
+
+    for (index, reference_cluster) in reference_clusters.items():
+        label = labels.get(index, None)
+        if (reference_to_label.setdefault(reference_cluster, label) != label or
+                label_to_reference.setdefault(label, reference_cluster) != reference_cluster):
+            mismatches += 1
+
+    return mismatches
 
 # ----------------------------------------------------------------------
 
 def test_clusters():
-    random.seed(0)
+    error_count = 0
+    rng = numpy.random.default_rng(0)
 
     print("Creating points")
     corner_points = place_corner_clusters()
-    noise_points = place_noise_points([0.5, 0.5, 0.5], [10, 10, 10], 100)
+    noise_points = place_noise_points([0.5, 0.5, 0.5], [10, 10, 10], 100, rng=rng)
 
-    all_points = corner_points + noise_points
+    all_points = numpy.concatenate([corner_points, noise_points])
 
     vertex_ids_as_strings = [ str(i) for i in range(len(all_points)) ]
     decorated_points = list(zip(all_points, vertex_ids_as_strings))
@@ -120,16 +226,47 @@ def test_clusters():
     
     if (sorted_int_ids != sorted_string_ids):
         print("ERROR: Cluster IDs for bare points do not match cluster IDs for decorated points.")
+        error_count += 1
         print("First 10 for bare points: {}".format(sorted_int_ids[0:10]))
         print("First 10 for decorated points (result): {}".format(sorted_string_ids[0:10]))
 
+    if SCIPY_AVAILABLE:
+        print("Checking cluster IDs against KD-tree reference clustering.")
+        reference_clusters = reference_core_clusters(all_points,
+                                                     [0.05, 0.05, 0.05],
+                                                     4)
+        mismatches = compare_with_reference(int_cluster_ids, reference_clusters)
+        if mismatches > 0:
+            print("ERROR: {} of {} core points are clustered differently than in the KD-tree reference.".format(
+                mismatches, len(reference_clusters)))
+            error_count += 1
+
 #    print("Cluster IDs: {}".format(cluster_ids))
 
+    return error_count
+
+# ----------------------------------------------------------------------
+
+def test_grid_kernel():
+    if not NUMBA_AVAILABLE:
+        return 0
+
+    print("Checking numba grid kernel against numpy.")
+    central_point = (0.5, -2.0, 10.0)
+    span = (0.1, 3.0, 0.5)
+    expected = grid_points_with_numpy(central_point, span, NUMBA_MIN_GRID_COUNT)
+    actual = grid_points_with_numba(central_point, span, NUMBA_MIN_GRID_COUNT)
+
+    if actual.shape != expected.shape or not numpy.allclose(actual, expected):
+        print("ERROR: Grid from numba kernel does not match grid from numpy.meshgrid.")
+        return 1
+    else:
+        return 0
+
 # ----------------------------------------------------------------------
 
 def main():
-    test_clusters()
-    return 0
+    return test_clusters() + test_grid_kernel()
 
 # ----------------------------------------------------------------------
 
@@ -29,6 +29,8 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 
+import types
+
 from tracktable.lib._cartesian2d import BasePointCartesian2D as BasePoint
 from tracktable.lib._cartesian2d import TrajectoryPointCartesian2D as TrajectoryPoint
 from tracktable.lib._cartesian2d import TrajectoryCartesian2D as Trajectory
@@ -42,7 +44,7 @@ from tracktable.lib._cartesian2d import TrajectoryWriterCartesian2D as Trajector
 
 DIMENSION = 2
 
-domain_classes = {
+DOMAIN_CLASSES = types.MappingProxyType({
     'BasePoint': BasePoint,
     'TrajectoryPoint': TrajectoryPoint,
     'BasePointReader': BasePointReader,
@@ -53,21 +55,13 @@ domain_classes = {
     'BasePointWriter': BasePointWriter,
     'TrajectoryPointWriter': TrajectoryPointWriter,
     'TrajectoryWriter': TrajectoryWriter
-}
+})
 
+# Kept for code that looks up the module-level name
+domain_classes = DOMAIN_CLASSES
 
-for domain_class in [
-        BasePoint,
-        TrajectoryPoint,
-        Trajectory,
-        BasePointReader,
-        TrajectoryPointReader,
-        TrajectoryReader,
-        BasePointWriter,
-        TrajectoryPointWriter,
-        TrajectoryWriter,
-        BoundingBox ]:
-    domain_class.domain_classes = domain_classes
+for domain_class in DOMAIN_CLASSES.values():
+    domain_class.domain_classes = DOMAIN_CLASSES
     domain_class.DOMAIN = "cartesian2d"
 
 def identity_projection(*coord_lists):
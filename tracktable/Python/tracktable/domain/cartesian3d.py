@@ -28,6 +28,8 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import types
+
 from tracktable.lib._cartesian3d import BasePointCartesian3D as BasePoint
 from tracktable.lib._cartesian3d import TrajectoryPointCartesian3D as TrajectoryPoint
 from tracktable.lib._cartesian3d import TrajectoryCartesian3D as Trajectory
@@ -42,7 +44,7 @@ from tracktable.lib._cartesian3d import TrajectoryWriterCartesian3D as Trajector
 
 DIMENSION = 3
 
-domain_classes = {
+DOMAIN_CLASSES = types.MappingProxyType({
     'BasePoint': BasePoint,
     'TrajectoryPoint': TrajectoryPoint,
     'BasePointReader': BasePointReader,
@@ -53,18 +55,11 @@ domain_classes = {
     'BasePointWriter': BasePointWriter,
     'TrajectoryPointWriter': TrajectoryPointWriter,
     'TrajectoryWriter': TrajectoryWriter
-}
+})
+
+# Kept for code that looks up the module-level name
+domain_classes = DOMAIN_CLASSES
 
-for domain_class in [
-        BasePoint,
-        TrajectoryPoint,
-        Trajectory,
-        BasePointReader,
-        TrajectoryPointReader,
-        TrajectoryReader,
-        BasePointWriter,
-        TrajectoryPointWriter,
-        TrajectoryWriter,
-        BoundingBox ]:
-    domain_class.domain_classes = domain_classes
+for domain_class in DOMAIN_CLASSES.values():
+    domain_class.domain_classes = DOMAIN_CLASSES
     domain_class.DOMAIN = "cartesian3d"
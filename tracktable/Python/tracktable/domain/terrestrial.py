@@ -28,6 +28,8 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import types
+
 from tracktable.lib._terrestrial import BasePointTerrestrial as BasePoint
 from tracktable.lib._terrestrial import TrajectoryPointTerrestrial as TrajectoryPoint
 from tracktable.lib._terrestrial import TrajectoryTerrestrial as Trajectory
@@ -41,7 +43,7 @@ from tracktable.lib._terrestrial import TrajectoryWriterTerrestrial as Trajector
 
 DIMENSION = 2
 
-domain_classes = {
+DOMAIN_CLASSES = types.MappingProxyType({
     'BasePoint': BasePoint,
     'TrajectoryPoint': TrajectoryPoint,
     'BasePointReader': BasePointReader,
@@ -52,18 +54,11 @@ domain_classes = {
     'BasePointWriter': BasePointWriter,
     'TrajectoryPointWriter': TrajectoryPointWriter,
     'TrajectoryWriter': TrajectoryWriter
-}
+})
+
+# Kept for code that looks up the module-level name
+domain_classes = DOMAIN_CLASSES
 
-for domain_class in [
-        BasePoint,
-        TrajectoryPoint,
-        Trajectory,
-        BasePointReader,
-        TrajectoryPointReader,
-        TrajectoryReader,
-        BasePointWriter,
-        TrajectoryPointWriter,
-        TrajectoryWriter,
-        BoundingBox ]:
-    domain_class.domain_classes = domain_classes
+for domain_class in DOMAIN_CLASSES.values():
+    domain_class.domain_classes = DOMAIN_CLASSES
     domain_class.DOMAIN = "terrestrial"
@@ -68,22 +68,25 @@ ANNOTATED_TRAJECTORIES = None
 
 def setup_encoder(encoder='ffmpeg',
                   codec=None,
-                  encoder_args=list(),
+                  encoder_args=(),
                   movie_title='Tracktable Movie',
                   movie_artist='Tracktable Trajectory Toolkit',
                   movie_comment='',
                   fps=20,
                   **kwargs):
 
-    if encoder not in matplotlib.animation.writers.list():
-        raise KeyError("Movie encoder {} is not available.  This system has the following encoders available: {}".format(encoder, matplotlib.animation.writers.list()))
+    available_encoders = matplotlib.animation.writers.list()
+    if encoder not in available_encoders:
+        raise KeyError("Movie encoder {} is not available.  This system has the following encoders available: {}".format(encoder, available_encoders))
 
     movie_metadata = { 'title': movie_title,
                        'artist': movie_artist,
                        'comment': movie_comment }
 
-    if type(encoder_args) is str or type(encoder_args) is unicode:
+    if isinstance(encoder_args, str):
         encoder_args = shlex.split(encoder_args)
+    else:
+        encoder_args = list(encoder_args)
 
 #    print("setup_encoder: encoder_args are '{}' with type {}".format(encoder_args, type(encoder_args)))
 
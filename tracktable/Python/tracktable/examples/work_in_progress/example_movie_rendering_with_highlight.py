@@ -50,41 +50,75 @@ of them.
 from __future__ import print_function, division, absolute_import
 
 import matplotlib.animation
+import numpy
 from matplotlib import pyplot
+import collections
+import concurrent.futures
 import datetime
+import functools
+import hashlib
+import io
+import os
+import pickle
 import shlex
+import tempfile
+import types
 import pdb
 
 from tracktable.core import Timestamp
 from tracktable.core.timestamp import SimpleTimeZone
-from tracktable.filter.trajectory import ClipToTimeWindow as ClipTrajectoryToTimeWindow, FilterByBoundingBox as FilterTrajectoriesByBoundingBox
 from tracktable.render import clock
 from tracktable.feature import annotations
 from tracktable.examples import example_trajectory_rendering
 
-ANNOTATED_TRAJECTORIES = None
-HIGHLIGHT_ANNOTATED_TRAJECTORIES = None
+# Annotating trajectories and unpacking them into arrays is expensive,
+# so render_trajectory_movie() keeps the SlidingTimeWindows built in its
+# last call and reuses them when it is called again with the same inputs
+# (for example, one batch of frames at a time).  Each window holds the
+# annotated trajectories along with their point times, coordinates and
+# scalars.
+MAIN_TIME_WINDOW = None
+HIGHLIGHT_TIME_WINDOW = None
+ANNOTATION_CACHE_KEY = None
+
+# Bump this whenever the contents of the on-disk annotation cache change
+# so that old entries are ignored instead of misread.
+ANNOTATION_CACHE_VERSION = 2
+
+# Read-only so that they can be shared as defaults and merged into
+# argument dicts without risk of being modified.
+NO_ARGUMENTS = types.MappingProxyType({})
+
+HIGHLIGHT_RENDERING_OVERRIDES = types.MappingProxyType({
+    'trajectory_initial_linewidth': 2,
+    'trajectory_final_linewidth': 1,
+    'trajectory_color_type': 'static',
+    'trajectory_color': 'white'
+    })
 
 # ----------------------------------------------------------------------
 
 def setup_encoder(encoder='ffmpeg',
                   codec=None,
-                  encoder_args=list(),
+                  encoder_args=(),
                   movie_title='Tracktable Movie',
                   movie_artist='Tracktable Trajectory Toolkit',
                   movie_comment='',
                   fps=20,
                   **kwargs):
 
-    if encoder not in matplotlib.animation.writers.list():
-        raise KeyError("Movie encoder {} is not available.  This system has the following encoders available: {}".format(encoder, matplotlib.animation.writers.list()))
+    available_encoders = matplotlib.animation.writers.list()
+    if encoder not in available_encoders:
+        raise KeyError("Movie encoder {} is not available.  This system has the following encoders available: {}".format(encoder, available_encoders))
 
     movie_metadata = { 'title': movie_title,
                        'artist': movie_artist,
                        'comment': movie_comment }
 
-    if type(encoder_args) is str or type(encoder_args) is unicode:
+    if isinstance(encoder_args, str):
         encoder_args = shlex.split(encoder_args)
+    else:
+        encoder_args = list(encoder_args)
 
 #    print("setup_encoder: encoder_args are '{}' with type {}".format(encoder_args, type(encoder_args)))
 
@@ -149,22 +183,330 @@ def compute_trajectory_time_bounds(trajectories):
        (start_time, end_time) - both Timestamp objects
     """
 
-    start_time = None
-    end_time = None
+    # Pull each trajectory's first and last timestamps into flat
+    # arrays of epoch seconds so that the min/max reductions happen in
+    # numpy instead of via Timestamp comparisons in Python.
+    nonempty = [ traj for traj in trajectories if len(traj) > 0 ]
+    if len(nonempty) == 0:
+        return (None, None)
+
+    starts = numpy.empty(len(nonempty), dtype=numpy.float64)
+    ends = numpy.empty_like(starts)
+    for (i, traj) in enumerate(nonempty):
+        starts[i] = traj[0].timestamp.timestamp()
+        ends[i] = traj[-1].timestamp.timestamp()
 
-    for traj in trajectories:
-        if len(traj) == 0:
+    start_time = nonempty[int(starts.argmin())][0].timestamp
+    end_time = nonempty[int(ends.argmax())][-1].timestamp
+
+    return (start_time, end_time)
+
+
+# ----------------------------------------------------------------------
+
+def compute_trajectory_extents(coordinates):
+    """Compute the longitude/latitude extent of each trajectory
+
+    Args:
+       coordinates: list of (N, 2) coordinate arrays from unpack_coordinates()
+
+    Returns:
+       numpy.ndarray with shape (N, 4) holding (min_lon, min_lat,
+       max_lon, max_lat) for each trajectory.  Empty trajectories get
+       NaN extents so they never pass an intersection test.
+    """
+
+    extents = numpy.full((len(coordinates), 4), numpy.nan)
+    for (i, coords) in enumerate(coordinates):
+        if len(coords) == 0:
             continue
+        extents[i, 0:2] = coords.min(axis=0)
+        extents[i, 2:4] = coords.max(axis=0)
+
+    return extents
+
+# ----------------------------------------------------------------------
+
+def filter_trajectories_by_map_extent(trajectories, basemap, coordinates=None):
+    """Keep only the trajectories whose extents overlap the map
+
+    This tests every trajectory's bounding box against the map corners
+    at once with a handful of numpy comparisons.  As with
+    FilterByBoundingBox, a trajectory that overlaps the map at all is
+    returned whole.
+
+    The coordinate arrays for the surviving trajectories come back too
+    so that SlidingTimeWindow can use them instead of reading every
+    point again.
+
+    Args:
+       trajectories: iterable of trajectories (None is treated as empty)
+       basemap: map with llcrnrlon, llcrnrlat, urcrnrlon, urcrnrlat attributes
+       coordinates: arrays from unpack_coordinates(), one per trajectory
+                    (computed if not supplied)
+
+    Returns:
+       (trajectories, coordinates) - lists for the trajectories that
+       overlap the map
+    """
+
+    if trajectories is None:
+        return ([], [])
+
+    trajectories = list(trajectories)
+    if coordinates is None:
+        coordinates = [ unpack_coordinates(traj) for traj in trajectories ]
+    if len(trajectories) == 0:
+        return (trajectories, coordinates)
+
+    extents = compute_trajectory_extents(coordinates)
+    overlaps = numpy.logical_and.reduce([
+        extents[:, 0] <= basemap.urcrnrlon,
+        extents[:, 2] >= basemap.llcrnrlon,
+        extents[:, 1] <= basemap.urcrnrlat,
+        extents[:, 3] >= basemap.llcrnrlat
+        ])
+
+    keep = numpy.flatnonzero(overlaps)
+    return ([ trajectories[i] for i in keep ],
+            [ coordinates[i] for i in keep ])
+
+# ----------------------------------------------------------------------
+
+def epoch_ns(timestamp):
+    """Convert a Timestamp to integer nanoseconds since the Unix epoch
+
+    Timestamps are only precise to the microsecond so we round there
+    before scaling up.
+
+    Args:
+       timestamp: Timestamp (timezone-aware datetime)
+
+    Returns:
+       Integer nanoseconds since 1970-01-01 00:00:00 UTC
+    """
+
+    return int(round(timestamp.timestamp() * 1e6)) * 1000
+
+# ----------------------------------------------------------------------
+
+def duration_ns(duration):
+    """Convert a datetime.timedelta to integer nanoseconds
+
+    Args:
+       duration: datetime.timedelta
+
+    Returns:
+       Integer nanoseconds (exact, since timedelta stops at microseconds)
+    """
+
+    return (duration // datetime.timedelta(microseconds=1)) * 1000
+
+# ----------------------------------------------------------------------
+
+def _as_epoch_ns(time):
+    """Pass through epoch nanoseconds; convert anything else with epoch_ns()"""
+    if isinstance(time, (int, numpy.integer)):
+        return int(time)
+    return epoch_ns(time)
+
+# ----------------------------------------------------------------------
+
+def compute_point_times(trajectory):
+    """Collect the timestamps of a trajectory's points in a sorted array
+
+    Points in a trajectory are already in time order, so the resulting
+    array can be used to find the points inside a time window without
+    looking at every point's Timestamp.
+
+    Args:
+       trajectory: Trajectory whose points will be indexed
+
+    Returns:
+       numpy.ndarray of int64 epoch nanoseconds, one per point
+    """
+
+    return numpy.fromiter((epoch_ns(point.timestamp) for point in trajectory),
+                          dtype=numpy.int64,
+                          count=len(trajectory))
+
+# ----------------------------------------------------------------------
+
+def unpack_coordinates(trajectory):
+    """Copy a trajectory's longitude/latitude into a flat array
+
+    Reading points through the Python wrappers is slow, so we do it
+    once per trajectory up front.  The map filter and the movie frames
+    then work on this array instead of touching the points again.
+    Single precision is plenty for drawing and halves the memory
+    traffic.
+
+    Args:
+       trajectory: trajectory to unpack
+
+    Returns:
+       float32 array with shape (N, 2)
+    """
+
+    return numpy.array([ (point[0], point[1]) for point in trajectory ],
+                       dtype=numpy.float32).reshape(-1, 2)
+
+# ----------------------------------------------------------------------
+
+def unpack_scalars(trajectory, scalar_accessor=None):
+    """Copy a trajectory's color scalars into a flat array
+
+    Args:
+       trajectory: annotated trajectory
+       scalar_accessor: function returning one scalar per point (default: all zeros)
+
+    Returns:
+       float32 array with shape (N,)
+    """
+
+    if scalar_accessor is None:
+        return numpy.zeros(len(trajectory), dtype=numpy.float32)
+    else:
+        return numpy.asarray(scalar_accessor(trajectory), dtype=numpy.float32)
+
+# ----------------------------------------------------------------------
+
+class SlidingTimeWindow(object):
+    """Clip a fixed set of trajectories to a time window that moves forward
+
+    Movie frames advance the trail window by the same amount every
+    frame, so the points inside it form a sliding window over each
+    trajectory's time-sorted points.  This class keeps a pair of cursors
+    per trajectory and only moves them forward, which makes the total
+    work across all frames proportional to the number of points instead
+    of points times frames.
+
+    The first window, and any window that moves backward, is located
+    with a binary search over the point times instead.  Unlike
+    ClipToTimeWindow we do not interpolate new endpoints at the window
+    boundaries.
+
+    Clipping hands back slices of each trajectory's coordinate and
+    scalar arrays (see unpack_coordinates() and unpack_scalars()).  Those slices are views,
+    so nothing is copied per frame.
+
+    Attributes:
+       trajectories (list): Trajectories being clipped
+       point_times (list): Arrays from compute_point_times(), one per trajectory
+       coordinates (list): (N, 2) float32 coordinate arrays, one per trajectory
+       scalars (list): (N,) float32 scalar arrays, one per trajectory
+    """
+
+    def __init__(self, trajectories, scalar_accessor=None, coordinates=None):
+        """Set up cursors for a list of trajectories.
+
+        Args:
+           trajectories: list of trajectories
+           scalar_accessor: function returning one color scalar per point
+           coordinates: arrays from unpack_coordinates() (computed if not supplied)
+        """
+
+        self.trajectories = trajectories
+        self.point_times = [ compute_point_times(traj) for traj in trajectories ]
+        if coordinates is None:
+            coordinates = [ unpack_coordinates(traj) for traj in trajectories ]
+
+        self.coordinates = list(coordinates)
+        self.scalars = [ unpack_scalars(traj, scalar_accessor) for traj in trajectories ]
+        self.reset()
+
+    def reset(self):
+        """Forget the current window so the next clip starts from scratch."""
+
+        self._first = [ 0 ] * len(self.trajectories)
+        self._last = [ 0 ] * len(self.trajectories)
+        self._start_ns = None
+        self._end_ns = None
+
+    def clip_arrays(self, start_time, end_time):
+        """Return array views of each trajectory inside [start_time, end_time]
+
+        Args:
+           start_time: Timestamp or epoch nanoseconds for the beginning of the window
+           end_time: Timestamp or epoch nanoseconds for the end of the window
+
+        Returns:
+           (coordinates, scalars) - lists of array views, one entry per
+           trajectory with at least one point in the window
+        """
+
+        self._move_to(start_time, end_time)
+
+        coordinates = []
+        scalars = []
+        for (i, (first, last)) in enumerate(zip(self._first, self._last)):
+            if last > first:
+                coordinates.append(self.coordinates[i][first:last])
+                scalars.append(self.scalars[i][first:last])
+
+        return (coordinates, scalars)
+
+    def _move_to(self, start_time, end_time):
+        start_ns = _as_epoch_ns(start_time)
+        end_ns = _as_epoch_ns(end_time)
 
-        if start_time is None:
-            start_time = traj[0].timestamp
-            end_time = traj[-1].timestamp
+        if (self._start_ns is None or
+                start_ns < self._start_ns or
+                end_ns < self._end_ns):
+            self._seek(start_ns, end_ns)
         else:
-            start_time = min(start_time, traj[0].timestamp)
-            end_time = max(end_time, traj[-1].timestamp)
+            self._advance(start_ns, end_ns)
+
+        self._start_ns = start_ns
+        self._end_ns = end_ns
+
+    def _seek(self, start_ns, end_ns):
+        for (i, times) in enumerate(self.point_times):
+            self._first[i] = int(numpy.searchsorted(times, start_ns, side='left'))
+            self._last[i] = int(numpy.searchsorted(times, end_ns, side='right'))
+
+    def _advance(self, start_ns, end_ns):
+        for (i, times) in enumerate(self.point_times):
+            num_points = len(times)
+            first = self._first[i]
+            last = self._last[i]
+            while last < num_points and times[last] <= end_ns:
+                last += 1
+            while first < num_points and times[first] < start_ns:
+                first += 1
+            self._first[i] = first
+            self._last[i] = last
 
-    return (start_time, end_time)
+# ----------------------------------------------------------------------
 
+def clip_and_render(window,
+                    start_time,
+                    end_time,
+                    basemap,
+                    axes=None,
+                    render_args=NO_ARGUMENTS):
+    """Render the parts of some trajectories that fall inside a time window
+
+    Args:
+       window:       SlidingTimeWindow over the trajectories to draw
+       start_time:   tail of the trail, as a Timestamp or integer epoch nanoseconds
+       end_time:     current frame, as a Timestamp or integer epoch nanoseconds
+       basemap:      map to draw into
+       axes:         Matplotlib axes to draw into
+       render_args:  keyword arguments for render_trajectory_arrays()
+
+    Returns:
+       List of artists added to the map
+    """
+
+    (coordinates, scalars) = window.clip_arrays(start_time, end_time)
+
+    return example_trajectory_rendering.render_trajectory_arrays(
+        basemap=basemap,
+        coordinates=coordinates,
+        scalars=scalars,
+        axes=axes,
+        **render_args)
 
 # ----------------------------------------------------------------------
 
@@ -173,49 +515,87 @@ def render_trajectories_for_frame(frame_time,
                                   main_trajectories,
                                   basemap,
                                   axes=None,
-                                  render_args=dict(),
+                                  render_args=NO_ARGUMENTS,
                                   frame_number=None,
                                   highlight_trajectories=None,
-                                  highlight_render_args=None):
+                                  highlight_render_args=None,
+                                  main_window=None,
+                                  highlight_window=None):
+    """Draw the main and highlight trails for one movie frame
 
-    clipped_trajectories = ClipTrajectoryToTimeWindow()
-    clipped_trajectories.input = main_trajectories
-    clipped_trajectories.start_time = trail_start_time
-    clipped_trajectories.end_time = frame_time
+    Args:
+       frame_time:       current frame, as a Timestamp or integer epoch nanoseconds
+       trail_start_time: tail of the trail, in the same form as frame_time
+       main_trajectories: trajectories to draw (only used if main_window is None)
+       basemap:          map to draw into
+       axes:             Matplotlib axes to draw into
+       render_args:      keyword arguments for render_trajectory_arrays()
+       frame_number:     index of this frame (unused; for debugging)
+       highlight_trajectories: trajectories to draw on top of the main ones
+       highlight_render_args: keyword arguments for drawing the highlights
+       main_window:      SlidingTimeWindow over main_trajectories (built if None)
+       highlight_window: SlidingTimeWindow over highlight_trajectories (built if None)
 
-    clip_result_main = list(clipped_trajectories.trajectories())
+    Returns:
+       List of artists added to the map
+    """
 
-    frame_data = example_trajectory_rendering.render_annotated_trajectories(
-        basemap=basemap,
-        trajectory_source=clip_result_main,
-        axes=axes,
-        **render_args)
+    if main_window is None:
+        render_args = dict(render_args)
+        main_window = SlidingTimeWindow(
+            main_trajectories,
+            scalar_accessor=render_args.pop('trajectory_scalar_accessor', None))
+
+    frame_data = clip_and_render(main_window,
+                                 trail_start_time,
+                                 frame_time,
+                                 basemap,
+                                 axes=axes,
+                                 render_args=render_args)
 
     if highlight_trajectories is not None and len(highlight_trajectories) > 0:
-        clipped_highlight = ClipTrajectoryToTimeWindow()
-        clipped_highlight.input = highlight_trajectories
-        clipped_highlight.start_time = trail_start_time
-        clipped_highlight.end_time = frame_time
+        if highlight_window is None:
+            highlight_render_args = dict(highlight_render_args)
+            highlight_window = SlidingTimeWindow(
+                highlight_trajectories,
+                scalar_accessor=highlight_render_args.pop('trajectory_scalar_accessor', None))
 
-        clip_result_highlight = list(clipped_highlight.trajectories())
-        frame_data += example_trajectory_rendering.render_annotated_trajectories(
-            basemap=basemap,
-            trajectory_source=clip_result_highlight,
-            axes=axes,
-            **highlight_render_args)
+        frame_data += clip_and_render(highlight_window,
+                                      trail_start_time,
+                                      frame_time,
+                                      basemap,
+                                      axes=axes,
+                                      render_args=highlight_render_args)
 
-    return frame_data;
+    return frame_data
 
 # ----------------------------------------------------------------------
 
-def format_time(timestamp, utc_offset=0, timezone_name=''):
-    minutes = timestamp.time().minute
-    minutes = 15 * int(minutes / 15)
+def _quarter_hour(timestamp):
+    """Round a timestamp down to the start of its 15-minute interval"""
+    return timestamp.replace(minute=15 * (timestamp.minute // 15),
+                             second=0,
+                             microsecond=0)
+
+@functools.lru_cache(maxsize=4096)
+def _format_quarter_hour(quarter_hour, utc_offset, format_string):
+    """Format a rounded timestamp in local time
+
+    Consecutive movie frames almost always land in the same 15-minute
+    interval, so we cache on the rounded timestamp and only pay for the
+    time zone conversion and strftime once per interval.
+    """
+
     local_timezone = SimpleTimeZone(hours=utc_offset)
-    newtime = timestamp.replace(minute=minutes).astimezone(local_timezone)
+    newtime = quarter_hour.astimezone(local_timezone)
+    return Timestamp.to_string(newtime, format_string=format_string, include_tz=False)
 
-    timestring = Timestamp.to_string(newtime, format_string='%Y-%m-%d %H:%M', include_tz=False)
-    return timestring
+# ----------------------------------------------------------------------
+
+def format_time(timestamp, utc_offset=0, timezone_name=''):
+    return _format_quarter_hour(_quarter_hour(timestamp),
+                                utc_offset,
+                                '%Y-%m-%d %H:%M')
 
 
 # ----------------------------------------------------------------------
@@ -226,6 +606,216 @@ def cleanup_frame(artists):
 
 # ----------------------------------------------------------------------
 
+class BackgroundFrameWriter(object):
+    """Feed rendered movie frames to the encoder from a worker thread
+
+    MovieWriter.grab_frame() renders the figure and then blocks while
+    the frame is written down the pipe to the encoder.  This class does
+    the rendering in the calling thread, into an in-memory buffer in
+    the writer's frame format, and hands the buffer to a single worker
+    thread that writes it to the pipe.  That lets the encoder work on
+    one frame while we draw the next.
+
+    At most max_pending frames are held in memory at once; grab_frame()
+    waits for the oldest write to finish before queueing another.
+    Writers that do not stream to a pipe (e.g. the file-based writers)
+    fall back to plain grab_frame().
+
+    This depends on matplotlib internals: the pipe-based writer's
+    encoder process (_proc), its frame size (_w, _h) and
+    matplotlib.animation._validate_grabframe_kwargs(), all present in
+    matplotlib 3.x.  If any of them is missing we fall back to plain
+    grab_frame() instead of guessing.
+
+    Call close() before leaving the movie writer's saving() context so
+    that every frame reaches the encoder.
+
+    Attributes:
+       movie_writer (MovieWriter): Writer that has already been set up
+       max_pending (int): Maximum number of frames waiting to be written
+    """
+
+    def __init__(self, movie_writer, max_pending=4):
+        """Attach to a movie writer that is inside its saving() context.
+
+        Args:
+           movie_writer: matplotlib.animation.MovieWriter
+           max_pending: maximum number of queued frames (default 4)
+        """
+
+        self.movie_writer = movie_writer
+        self.max_pending = max_pending
+        self._pending = collections.deque()
+
+        process = getattr(movie_writer, '_proc', None)
+        self._validate_kwargs = getattr(matplotlib.animation,
+                                        '_validate_grabframe_kwargs',
+                                        None)
+        if (isinstance(movie_writer, matplotlib.animation.FileMovieWriter) or
+                process is None or process.stdin is None or
+                self._validate_kwargs is None or
+                not hasattr(movie_writer, '_w') or
+                not hasattr(movie_writer, '_h')):
+            self._pipe = None
+            self._executor = None
+        else:
+            self._pipe = process.stdin
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def grab_frame(self, **savefig_kwargs):
+        """Render the current figure and queue it for the encoder.
+
+        Keyword arguments are checked and passed to savefig() just as
+        they are by MovieWriter.grab_frame().
+        """
+
+        if self._pipe is None:
+            self.movie_writer.grab_frame(**savefig_kwargs)
+            return
+
+        self._validate_kwargs(savefig_kwargs)
+
+        # The encoder reads raw frames of a fixed size, so undo any
+        # change the caller made to the figure size, as
+        # MovieWriter.grab_frame() does.
+        self.movie_writer.fig.set_size_inches(self.movie_writer._w,
+                                              self.movie_writer._h)
+
+        frame_buffer = io.BytesIO()
+        self.movie_writer.fig.savefig(frame_buffer,
+                                      format=self.movie_writer.frame_format,
+                                      dpi=self.movie_writer.dpi,
+                                      **savefig_kwargs)
+
+        while len(self._pending) >= self.max_pending:
+            self._pending.popleft().result()
+
+        self._pending.append(
+            self._executor.submit(self._pipe.write, frame_buffer.getvalue()))
+
+    def close(self):
+        """Wait for all queued frames to be written and stop the worker."""
+
+        if self._executor is None:
+            return
+
+        try:
+            while len(self._pending) > 0:
+                self._pending.popleft().result()
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+# ----------------------------------------------------------------------
+
+def annotation_cache_key(source_filenames, basemap, *rendering_args):
+    """Compute a key for annotated trajectories stored on disk
+
+    The key changes whenever one of the source files is modified, the
+    map extent moves, the trajectory coloring changes or the cache
+    format (ANNOTATION_CACHE_VERSION) changes.
+
+    Args:
+       source_filenames: list of files the trajectories were read from
+       basemap: map with llcrnrlon, llcrnrlat, urcrnrlon, urcrnrlat attributes
+       rendering_args: trajectory rendering argument dicts
+
+    Returns:
+       Hex digest string
+    """
+
+    sources = [ (os.path.abspath(filename), os.path.getmtime(filename))
+                for filename in source_filenames ]
+    corners = (basemap.llcrnrlon, basemap.llcrnrlat,
+               basemap.urcrnrlon, basemap.urcrnrlat)
+    colors = [ (args.get('trajectory_color_type'), args.get('trajectory_color'))
+               for args in rendering_args ]
+
+    return hashlib.sha1(repr((ANNOTATION_CACHE_VERSION, sources, corners, colors)).encode('utf-8')).hexdigest()
+
+# ----------------------------------------------------------------------
+
+def load_cached_annotations(cache_dir, key):
+    """Load annotated trajectories saved by save_cached_annotations()
+
+    Args:
+       cache_dir: directory holding cached annotations
+       key: string from annotation_cache_key()
+
+    Returns:
+       Whatever was saved under that key, or None if there is no entry
+    """
+
+    cache_filename = os.path.join(cache_dir, '{}.pkl'.format(key))
+    if not os.path.exists(cache_filename):
+        return None
+
+    with open(cache_filename, 'rb') as infile:
+        return pickle.load(infile)
+
+# ----------------------------------------------------------------------
+
+def save_cached_annotations(cache_dir, key, annotated):
+    """Save annotated trajectories so later runs can skip annotation
+
+    render_trajectory_movie() stores its SlidingTimeWindows here, so
+    the unpacked point times, coordinates and scalars are saved along
+    with the trajectories.
+
+    The file is written under a temporary name and then moved into
+    place so that an interrupted run never leaves a partial entry.
+
+    Args:
+       cache_dir: directory holding cached annotations (created if needed)
+       key: string from annotation_cache_key()
+       annotated: picklable object to store
+    """
+
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    cache_filename = os.path.join(cache_dir, '{}.pkl'.format(key))
+    (fd, temp_filename) = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as outfile:
+            pickle.dump(annotated, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_filename, cache_filename)
+    except Exception:
+        os.remove(temp_filename)
+        raise
+
+# ----------------------------------------------------------------------
+
+def prepare_render_args(trajectory_rendering_args):
+    """Convert trajectory rendering arguments for render_trajectory_arrays()
+
+    The trajectory_rendering argument group describes color with
+    'trajectory_color_type' and 'trajectory_color'.  The renderer wants
+    a colormap instead.  For scalar coloring we also add a
+    'trajectory_scalar_accessor' entry, which the caller must pop and
+    hand to SlidingTimeWindow before passing the rest to the renderer.
+
+    Args:
+       trajectory_rendering_args: dict of trajectory rendering arguments
+
+    Returns:
+       New dict of arguments for render_trajectory_arrays(), plus
+       'trajectory_scalar_accessor' when coloring by a scalar
+    """
+
+    render_args = dict(trajectory_rendering_args)
+    color_type = render_args.pop('trajectory_color_type')
+    color = render_args.pop('trajectory_color', None)
+
+    if color_type == 'static':
+        render_args['trajectory_colormap'] = example_trajectory_rendering.make_constant_colormap(color)
+    elif color_type == 'scalar' and color is not None:
+        render_args['trajectory_scalar_accessor'] = annotations.retrieve_feature_accessor(color)
+
+    return render_args
+
+# ----------------------------------------------------------------------
+
 def render_trajectory_movie(movie_writer,
                             basemap,
                             main_trajectories,
@@ -238,63 +828,105 @@ def render_trajectory_movie(movie_writer,
                             filename='movie.mp4',
                             start_time=None,
                             end_time=None,
-                            savefig_kwargs=dict(),
-                            trajectory_rendering_args=dict(),
+                            savefig_kwargs=NO_ARGUMENTS,
+                            trajectory_rendering_args=NO_ARGUMENTS,
                             frame_batch_size=100,
                             utc_offset=0,
                             timezone_label=None,
                             highlight_trajectories=None,
-                            axes=None):
+                            axes=None,
+                            annotation_cache_dir=None,
+                            source_filenames=None):
 
 #    pdb.set_trace()
 
+    # frame_batch_size is accepted, and ignored, so that this function
+    # takes the same arguments as the one in example_movie_rendering.
+
     if timezone_label is None:
         timezone_label = ''
 
-    local_savefig_kwargs = dict(savefig_kwargs)
-    local_trajectory_rendering_args = dict(trajectory_rendering_args)
-
-    # First, filter down to just the trajectories that intersect the map
-    main_bbox_filter = FilterTrajectoriesByBoundingBox()
-    main_bbox_filter.input = main_trajectories
-    main_bbox_filter.bounding_box = ( ( basemap.llcrnrlon,
-                                        basemap.llcrnrlat ),
-                                      ( basemap.urcrnrlon,
-                                        basemap.urcrnrlat ) )
-    main_trajectories_on_map = list(main_bbox_filter.trajectories())
-
-    highlight_bbox_filter = FilterTrajectoriesByBoundingBox()
-    highlight_bbox_filter.input = highlight_trajectories
-    highlight_bbox_filter.bounding_box =  ( ( basemap.llcrnrlon,
-                                              basemap.llcrnrlat ),
-                                            ( basemap.urcrnrlon,
-                                              basemap.urcrnrlat ) )
-    highlight_trajectories_on_map = list(highlight_bbox_filter.trajectories())
-    highlight_rendering_args = dict(trajectory_rendering_args)
-
-    global ANNOTATED_TRAJECTORIES
-    if not ANNOTATED_TRAJECTORIES:
-        print("Annotating trajectories (should only happen once)")
-        annotated_trajectories = list(annotate_trajectories(main_trajectories_on_map,
-                                                            **local_trajectory_rendering_args))
-        ANNOTATED_TRAJECTORIES = annotated_trajectories
-
-        if len(highlight_trajectories_on_map) > 0:
-            highlight_rendering_args['trajectory_initial_linewidth'] = 2
-            highlight_rendering_args['trajectory_final_linewidth'] = 1
-            highlight_rendering_args['trajectory_color'] = 'white'
-            highlight_annotated_trajectories = list(annotate_trajectories(highlight_trajectories_on_map,
-                                                                          **highlight_rendering_args))
-            HIGHLIGHT_ANNOTATED_TRAJECTORIES = highlight_annotated_trajectories
-    else:
+    # Nothing below modifies these, so there is no need to copy them.
+    # prepare_render_args() builds the dicts that the frame loop uses.
+    local_savefig_kwargs = savefig_kwargs
+    local_trajectory_rendering_args = trajectory_rendering_args
+    highlight_rendering_args = dict(trajectory_rendering_args,
+                                    **HIGHLIGHT_RENDERING_OVERRIDES)
+
+    # We've handled the color arguments ourselves - don't pass them on
+    main_render_args = prepare_render_args(local_trajectory_rendering_args)
+    highlight_render_args = prepare_render_args(highlight_rendering_args)
+    main_scalar_accessor = main_render_args.pop('trajectory_scalar_accessor', None)
+    highlight_scalar_accessor = highlight_render_args.pop('trajectory_scalar_accessor', None)
+
+    global MAIN_TIME_WINDOW
+    global HIGHLIGHT_TIME_WINDOW
+    global ANNOTATION_CACHE_KEY
+
+    cache_key = (id(main_trajectories), id(highlight_trajectories))
+    if MAIN_TIME_WINDOW is not None and ANNOTATION_CACHE_KEY == cache_key:
         print("Re-using trajectory annotations")
-        annotated_trajectories = ANNOTATED_TRAJECTORIES
-        highlight_annotated_trajectories = HIGHLIGHT_ANNOTATED_TRAJECTORIES
+        main_window = MAIN_TIME_WINDOW
+        highlight_window = HIGHLIGHT_TIME_WINDOW
+    else:
+        disk_cache_key = None
+        cached_annotations = None
+        if annotation_cache_dir is not None and source_filenames is not None:
+            disk_cache_key = annotation_cache_key(source_filenames,
+                                                  basemap,
+                                                  local_trajectory_rendering_args,
+                                                  highlight_rendering_args)
+            cached_annotations = load_cached_annotations(annotation_cache_dir,
+                                                         disk_cache_key)
+
+        if cached_annotations is not None:
+            print("Loaded trajectory annotations from {}".format(annotation_cache_dir))
+            (main_window, highlight_window) = cached_annotations
+        else:
+            # First, filter down to just the trajectories that intersect the map
+            # and keep their coordinates for the windows below.
+            (main_trajectories_on_map,
+             main_coordinates) = filter_trajectories_by_map_extent(main_trajectories, basemap)
+            (highlight_trajectories_on_map,
+             highlight_coordinates) = filter_trajectories_by_map_extent(highlight_trajectories, basemap)
+
+            print("Annotating trajectories (should only happen once)")
+            annotated_trajectories = list(annotate_trajectories(main_trajectories_on_map,
+                                                                **local_trajectory_rendering_args))
+
+            if len(highlight_trajectories_on_map) > 0:
+                highlight_annotated_trajectories = list(annotate_trajectories(highlight_trajectories_on_map,
+                                                                              **highlight_rendering_args))
+            else:
+                highlight_annotated_trajectories = []
+
+            # Index the point timestamps and unpack the geometry and
+            # scalars once.  The windows then track which points are in
+            # the trail as it slides forward frame by frame.
+            main_window = SlidingTimeWindow(annotated_trajectories,
+                                            scalar_accessor=main_scalar_accessor,
+                                            coordinates=main_coordinates)
+            highlight_window = SlidingTimeWindow(highlight_annotated_trajectories,
+                                                 scalar_accessor=highlight_scalar_accessor,
+                                                 coordinates=highlight_coordinates)
+
+            if disk_cache_key is not None:
+                save_cached_annotations(annotation_cache_dir,
+                                        disk_cache_key,
+                                        (main_window, highlight_window))
+
+        MAIN_TIME_WINDOW = main_window
+        HIGHLIGHT_TIME_WINDOW = highlight_window
+        ANNOTATION_CACHE_KEY = cache_key
+
+    # A reused window still has its cursors wherever the last call left them
+    main_window.reset()
+    highlight_window.reset()
+    annotated_trajectories = main_window.trajectories
+    highlight_annotated_trajectories = highlight_window.trajectories
 
     print("Annotated trajectories retrieved.")
 
-    if local_trajectory_rendering_args['trajectory_color_type'] == 'static':
-        local_trajectory_rendering_args['trajectory_colormap'] = example_trajectory_rendering.make_constant_colormap(local_trajectory_rendering_args['trajectory_color'])
 
     (data_start_time, data_end_time) = compute_trajectory_time_bounds(annotated_trajectories)
     if end_time is None:
@@ -318,33 +950,20 @@ def render_trajectory_movie(movie_writer,
     frame_duration = (end_time - start_time) / num_frames_overall
     first_frame_time = start_time + trail_duration
 
-    if (local_trajectory_rendering_args['trajectory_color_type'] == 'scalar' and
-        local_trajectory_rendering_args.get('trajectory_color', None) is not None):
-        scalar_accessor = annotations.retrieve_feature_accessor(local_trajectory_rendering_args['trajectory_color'])
-    else:
-        scalar_accessor = None
-
-    # We've handled these args ourselves - don't pass them on
-    del local_trajectory_rendering_args['trajectory_color_type']
-    del local_trajectory_rendering_args['trajectory_color']
-
-    if scalar_accessor is not None:
-        local_trajectory_rendering_args['trajectory_scalar_accessor'] = scalar_accessor
-
     def frame_time(which_frame):
         return first_frame_time + which_frame * frame_duration
 
+    first_frame_ns = epoch_ns(first_frame_time)
+    frame_duration_ns = duration_ns(frame_duration)
+    trail_duration_ns = duration_ns(trail_duration)
 
-    def my_format_time(timestamp):
-        minutes = timestamp.time().minute
-        minutes = 15 * int(minutes / 15)
-        local_timezone = SimpleTimeZone(hours=utc_offset)
-        newtime = timestamp.replace(minute=minutes).astimezone(local_timezone)
 
-        timestring = Timestamp.to_string(newtime, format_string='%Y-%m-%d\n%H:%M {}'.format(
-            timezone_label), include_tz=False)
+    clock_format_string = '%Y-%m-%d\n%H:%M {}'.format(timezone_label)
 
-        return timestring
+    def my_format_time(timestamp):
+        return _format_quarter_hour(_quarter_hour(timestamp),
+                                    utc_offset,
+                                    clock_format_string)
 
 
 
@@ -363,51 +982,48 @@ def render_trajectory_movie(movie_writer,
         figure = pyplot.gcf()
 
     print("Rendering to {}".format(filename))
-    current_trajectory_batch = None
-    with movie_writer.saving(figure, filename, dpi):
-
-        for i in range(first_frame, first_frame+num_frames):
-
-            current_time = frame_time(i)
-            trail_start_time = frame_time(i) - trail_duration
-
-            print("Rendering frame {}: current_time {}, trail_start_time {}".format(
-                i,
-                current_time.strftime("%Y-%m-%d %H:%M:%S"),
-                trail_start_time.strftime("%Y-%m-%d %H:%M:%S")))
-
-            current_trajectory_batch = list(annotated_trajectories)
-#            print("Frame {}: trajectory batch contains {} items".format(i, len(current_trajectory_batch)))
-
-#            if (i+1) % 10 == 0:
-#                print("Rendering frame {}.  Batch extends to frame {}.".format(i, first_frame+num_frames-1))
-
-            frame_data = render_trajectories_for_frame(
-                frame_time=current_time,
-                trail_start_time=trail_start_time,
-                trajectories=current_trajectory_batch,
-                basemap=basemap,
-                axes=axes,
-                render_args=local_trajectory_rendering_args,
-                frame_number=i
-                )
-
-            if len(highlight_annotated_trajectories) > 0:
-                frame_data += render_trajectories_for_frame(
-                    frame_time=current_frame,
-                    trail_start_time=trail_start_time,
-                    trajectories=highlight_annotated_trajectories,
-                    basemap=basemap,
-                    axes=axes,
-                    render_args=highlight_rendering_args,
-                    frame_number=i
-                )
-
-            clock_artist.set_text(my_format_time(current_time))
-
-            next_filename = 'test_frame_{}.png'.format(i)
-            movie_writer.grab_frame(**local_savefig_kwargs)
-            cleanup_frame(frame_data)
-
-            current_time += frame_duration
-            trail_start_time += frame_duration
+    # Callers may reuse one figure for several calls (one batch of
+    # frames at a time), so take the clock back off when we are done
+    # with it.
+    try:
+        with movie_writer.saving(figure, filename, dpi):
+
+            frame_writer = BackgroundFrameWriter(movie_writer)
+            try:
+                for i in range(first_frame, first_frame+num_frames):
+
+                    # Frame times are plain integers from here down; only
+                    # the clock needs a real Timestamp.
+                    current_ns = first_frame_ns + i * frame_duration_ns
+                    trail_start_ns = current_ns - trail_duration_ns
+                    current_time = frame_time(i)
+
+                    print("Rendering frame {}: current_time {}".format(
+                        i,
+                        current_time.strftime("%Y-%m-%d %H:%M:%S")))
+
+#                    if (i+1) % 10 == 0:
+#                        print("Rendering frame {}.  Batch extends to frame {}.".format(i, first_frame+num_frames-1))
+
+                    frame_data = render_trajectories_for_frame(
+                        frame_time=current_ns,
+                        trail_start_time=trail_start_ns,
+                        main_trajectories=annotated_trajectories,
+                        basemap=basemap,
+                        axes=axes,
+                        render_args=main_render_args,
+                        frame_number=i,
+                        highlight_trajectories=highlight_annotated_trajectories,
+                        highlight_render_args=highlight_render_args,
+                        main_window=main_window,
+                        highlight_window=highlight_window
+                        )
+
+                    clock_artist.set_text(my_format_time(current_time))
+
+                    frame_writer.grab_frame(**local_savefig_kwargs)
+                    cleanup_frame(frame_data)
+            finally:
+                frame_writer.close()
+    finally:
+        clock_artist.remove()
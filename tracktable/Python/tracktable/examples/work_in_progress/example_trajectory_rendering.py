@@ -44,6 +44,7 @@ address questions such as...
 """
 
 import matplotlib.colors
+from matplotlib.collections import LineCollection
 
 from tracktable.feature import annotations
 from tracktable.render import paths
@@ -340,6 +341,157 @@ def render_annotated_trajectories(basemap,
 
 # ----------------------------------------------------------------------
 
+def render_trajectory_arrays(basemap,
+                             coordinates,
+                             scalars,
+                             trajectory_colormap="gist_heat",
+                             trajectory_zorder=10,
+                             decorate_trajectory_head=False,
+                             trajectory_head_dot_size=2,
+                             trajectory_head_color="white",
+                             trajectory_linewidth=0.5,
+                             trajectory_initial_linewidth=0.5,
+                             trajectory_final_linewidth=0.01,
+                             scalar_min=0,
+                             scalar_max=1,
+                             axes=None):
+
+    """Render trajectories that have already been unpacked into arrays.
+
+    This draws the same picture as render_annotated_trajectories() but
+    takes each trajectory as a pair of numpy arrays instead of a
+    Trajectory object: an (N, 2) array of longitude/latitude and an
+    (N,) array of color scalars.  Callers that draw the same
+    trajectories many times (such as movie renderers) can unpack them
+    once and pass slices here without going back through the point
+    wrappers.
+
+    All segments from all trajectories go into a single LineCollection
+    so that each call adds at most two artists: the lines and, if
+    requested, the head dots.
+
+    Args:
+       basemap:                  Map instance to draw into
+       coordinates:              List of (N, 2) coordinate arrays
+       scalars:                  List of (N,) scalar arrays matching coordinates
+       trajectory_colormap:      Colormap to map between scalars and colors
+       trajectory_zorder:        Image layer for trajectory geometry
+       decorate_trajectory_head: Whether or not to draw a dot at the head of each trajectory
+       trajectory_head_dot_size: Size (in points) for the dot at the head of each trajectory
+       trajectory_head_color:    Name/hex string for color of trajectory dots
+       trajectory_linewidth:     Trajectory linewidth in points or 'taper'
+       trajectory_initial_linewidth: If trajectory_linewidth is 'taper', lines will be this
+                                 wide at the head of the trajectory
+       trajectory_final_linewidth: If trajectory_linewidth is 'taper', lines will be this
+                                 wide at the tail of the trajectory
+       scalar_min (float):       Scalar value to map to bottom of color map
+       scalar_max (float):       Scalar value to map to top of color map
+       axes:                     Artists will be added to this Axes instance instead of the default
+
+    Returns:
+       A list of the artists added to the basemap
+    """
+
+    if axes is None:
+        axes = pyplot.gca()
+
+    color_scale = matplotlib.colors.Normalize(vmin=scalar_min, vmax=scalar_max)
+
+    # Same outlier rule as paths.draw_traffic(): segments that span
+    # more than half the map are almost always errors in the data.
+    if hasattr(basemap, 'get_extent'):
+        map_extent = basemap.get_extent()
+        max_segment_length = 0.5 * max(map_extent[2] - map_extent[0],
+                                       map_extent[3] - map_extent[1])
+    else:
+        max_segment_length = None
+
+    all_artists = []
+
+    # Trajectories with fewer than two points draw nothing at all, not
+    # even a head dot.
+    drawn = [(points, point_scalars)
+             for (points, point_scalars) in zip(coordinates, scalars)
+             if len(points) >= 2]
+    if len(drawn) == 0:
+        return all_artists
+
+    # Lay every trajectory end to end and remember which one each
+    # point came from so that we never join two trajectories together.
+    points = numpy.concatenate([item[0] for item in drawn])
+    point_scalars = numpy.concatenate([item[1] for item in drawn])
+    trajectory_ids = numpy.repeat(numpy.arange(len(drawn)),
+                                  [len(item[0]) for item in drawn])
+
+    # Drop adjacent duplicate positions so that no segment is degenerate
+    keep = numpy.ones(len(points), dtype=bool)
+    keep[1:] = numpy.logical_or(
+        numpy.any(points[1:] != points[:-1], axis=1),
+        trajectory_ids[1:] != trajectory_ids[:-1])
+    points = points[keep]
+    point_scalars = point_scalars[keep]
+    trajectory_ids = trajectory_ids[keep]
+
+    trajectory_lengths = numpy.bincount(trajectory_ids, minlength=len(drawn))
+    trajectory_ends = numpy.cumsum(trajectory_lengths)
+    trajectory_starts = trajectory_ends - trajectory_lengths
+
+    # A segment runs from point i to point i+1 when both belong to the
+    # same trajectory.
+    segment_starts = numpy.flatnonzero(trajectory_ids[1:] == trajectory_ids[:-1])
+
+    if len(segment_starts) > 0:
+        segments = numpy.stack((points[segment_starts],
+                                points[segment_starts + 1]), axis=1)
+        if max_segment_length:
+            lengths = numpy.hypot(segments[:, 1, 0] - segments[:, 0, 0],
+                                  segments[:, 1, 1] - segments[:, 0, 1])
+            too_long = lengths > max_segment_length
+            segments[too_long, 1] = segments[too_long, 0]
+
+        if trajectory_linewidth == 'taper':
+            # Vectorized form of _make_tapered_linewidth_generator():
+            # point k of an n-point trajectory gets the k'th entry of
+            # linspace(final, initial, n).
+            segment_ids = trajectory_ids[segment_starts]
+            position = segment_starts - trajectory_starts[segment_ids]
+            fraction = position / (trajectory_lengths[segment_ids] - 1.0)
+            linewidths = (trajectory_final_linewidth +
+                          fraction * (trajectory_initial_linewidth -
+                                      trajectory_final_linewidth))
+        else:
+            linewidths = trajectory_linewidth
+
+        segment_collection = LineCollection(segments,
+                                            norm=color_scale,
+                                            cmap=trajectory_colormap,
+                                            linewidth=linewidths,
+                                            zorder=trajectory_zorder)
+        segment_collection.set_array(point_scalars[segment_starts])
+        axes.add_collection(segment_collection)
+        all_artists.append(segment_collection)
+
+    if decorate_trajectory_head:
+        lead_points = points[trajectory_ends - 1]
+        lead_scalars = point_scalars[trajectory_ends - 1]
+        if trajectory_head_color == 'body':
+            dot_color_kwargs = { 'cmap': trajectory_colormap,
+                                 'norm': color_scale,
+                                 'c': lead_scalars }
+        else:
+            dot_color_kwargs = { 'c': trajectory_head_color }
+
+        all_artists.append(axes.scatter(lead_points[:, 0], lead_points[:, 1],
+                                        s=trajectory_head_dot_size,
+                                        linewidth=0,
+                                        marker='o',
+                                        zorder=trajectory_zorder+1,
+                                        **dot_color_kwargs))
+
+    return all_artists
+
+# ----------------------------------------------------------------------
+
 
 def _make_tapered_linewidth_generator(initial_linewidth,
                                       final_linewidth):